@@ -1,17 +1,96 @@
+import multiprocessing
 import time
+from collections import OrderedDict
 
 import argparse
 import matplotlib.animation as manimation
 import matplotlib.gridspec as gridspec
 import matplotlib.pyplot as plt
+import numpy as np
 import yaml
 
 from visual_dynamics import envs
 from visual_dynamics.gui.grid_image_visualizer import GridImageVisualizer
-from visual_dynamics.utils.config import from_config
+from visual_dynamics.utils.config import Python2to3Loader, from_config
 from visual_dynamics.utils.container import ImageDataContainer
 
 
+def rollout(env, pol, num_steps, step_callback=None):
+    """
+    Runs a single trajectory of the policy in the environment
+
+    Args:
+        env: environment to run the policy in.
+        pol: policy that chooses the actions.
+        num_steps: number of time steps of the trajectory.
+        step_callback: optional function that is called with the observation
+            after every time step. The trajectory is terminated early if this
+            function returns True.
+
+    Returns:
+        observations: dict mapping each sensor name to an array with the
+            observations of all the time steps.
+        states: array of states, with one more entry than actions.
+        actions: array of actions.
+        stopped: whether step_callback terminated the trajectory.
+    """
+    state = pol.reset()
+    obs = env.reset(state)
+    if state is None:
+        state = env.get_state()
+    state = np.asarray(state)
+    states = np.empty((num_steps + 1,) + state.shape, dtype=state.dtype)
+    states[0] = state
+    observations = OrderedDict()
+    for name, sensor_obs in obs.items():
+        observations[name] = np.empty((num_steps + 1,) + sensor_obs.shape, dtype=sensor_obs.dtype)
+        observations[name][0] = sensor_obs
+    actions = None
+    num_actions = 0
+    stopped = False
+    for step_iter in range(num_steps):
+        action = pol.act(obs)
+        if actions is None:
+            action = np.asarray(action)
+            actions = np.empty((num_steps,) + action.shape, dtype=action.dtype)
+        obs, _, episode_done, _ = env.step(action)  # action is updated in-place if needed
+        if episode_done:
+            raise NotImplementedError('Early termination of episodes is not allowed during data generation/collection.')
+        for name, sensor_obs in obs.items():
+            observations[name][step_iter + 1] = sensor_obs
+        states[step_iter + 1] = env.get_state()
+        actions[step_iter] = action  # copied since policies may return the same array at every step
+        num_actions += 1
+        if step_callback is not None and step_callback(obs):
+            stopped = True
+            break
+    if actions is None:
+        actions = np.empty((0,))
+    if num_actions < num_steps:
+        observations = OrderedDict([(name, observation[:num_actions + 1]) for (name, observation) in observations.items()])
+        states = states[:num_actions + 1]
+        actions = actions[:num_actions]
+    return observations, states, actions, stopped
+
+
+# environment and policy of each worker process, which are constructed only once per worker
+_worker_env = None
+_worker_pol = None
+
+
+def _init_worker(env_config, policy_config):
+    global _worker_env, _worker_pol
+    np.random.seed()  # each worker has its own random state
+    _worker_env = from_config(env_config)
+    replace_config = {'env': _worker_env,
+                      'action_space': _worker_env.action_space}
+    _worker_pol = from_config(policy_config, replace_config=replace_config)
+
+
+def _rollout_worker(num_steps):
+    return rollout(_worker_env, _worker_pol, num_steps)
+
+
 def main():
     parser = argparse.ArgumentParser()
     parser.add_argument('env_fname', type=str, help='config file with environment arguments')
@@ -19,19 +98,26 @@ def main():
     parser.add_argument('--output_dir', '-o', type=str, default=None)
     parser.add_argument('--num_trajs', '-n', type=int, default=10, metavar='N', help='total number of data points is N*T')
     parser.add_argument('--num_steps', '-t', type=int, default=10, metavar='T', help='number of time steps per trajectory')
+    parser.add_argument('--num_workers', '-w', type=int, default=1, help='number of processes collecting trajectories')
     parser.add_argument('--visualize', '-v', type=int, default=None)
     parser.add_argument('--record_file', '-r', type=str, default=None)
     args = parser.parse_args()
 
+    if args.record_file and not args.visualize:
+        args.visualize = 1
+    num_workers = min(args.num_workers, args.num_trajs, multiprocessing.cpu_count())
+
     with open(args.env_fname) as yaml_string:
-        env_config = yaml.load(yaml_string)
+        env_config = yaml.load(yaml_string, Loader=Python2to3Loader)
         if issubclass(env_config['class'], envs.RosEnv):
+            if num_workers > 1:
+                parser.error('ros environments are only supported when using a single worker')
             import rospy
             rospy.init_node("generate_data")
         env = from_config(env_config)
 
     with open(args.pol_fname) as yaml_string:
-        policy_config = yaml.load(yaml_string)
+        policy_config = yaml.load(yaml_string, Loader=Python2to3Loader)
         replace_config = {'env': env,
                           'action_space': env.action_space}
         pol = from_config(policy_config, replace_config=replace_config)
@@ -46,8 +132,6 @@ def main():
     else:
         container = None
 
-    if args.record_file and not args.visualize:
-        args.visualize = 1
     if args.visualize:
         fig = plt.figure(figsize=(16, 12), frameon=False, tight_layout=True)
         gs = gridspec.GridSpec(1, 1)
@@ -59,45 +143,61 @@ def main():
             writer = FFMpegWriter(fps=1.0 / env.dt)
             writer.setup(fig, args.record_file, fig.dpi)
 
+        def visualize(obs):
+            """
+            Returns True if the visualization has been closed.
+            """
+            try:
+                image_visualizer.update(obs.values())
+                if args.record_file:
+                    writer.grab_frame()
+            except:
+                return True
+            return False
+
+    if num_workers > 1:
+        # each worker constructs its own environment and policy, and only the trajectories are sent back. The workers
+        # are spawned instead of forked since the simulator and graphics state of this process is not safe to fork.
+        env.close()
+        pool = multiprocessing.get_context('spawn').Pool(num_workers, initializer=_init_worker,
+                                                         initargs=(env_config, policy_config))
+        trajs = pool.imap(_rollout_worker, [args.num_steps] * args.num_trajs)
+    else:
+        pool = None
+        if args.visualize:
+            def step_callback(obs):
+                env.render()
+                return visualize(obs)
+        else:
+            step_callback = None
+        trajs = (rollout(env, pol, args.num_steps, step_callback=step_callback) for _ in range(args.num_trajs))
+
     start_time = time.time()
     done = False
-    for traj_iter in range(args.num_trajs):
-        print('traj_iter', traj_iter)
-        try:
-            state = pol.reset()
-            obs = env.reset(state)
-            if state is None:
-                state = env.get_state()
-            for step_iter in range(args.num_steps):
-                if container:
-                    container.add_datum(traj_iter, step_iter, state=state, **obs)
-
-                action = pol.act(obs)
-                obs, _, episode_done, _ = env.step(action)  # action is updated in-place if needed
-                if episode_done:
-                    raise NotImplementedError('Early termination of episodes is not allowed during data generation/collection.')
-
-                if container:
-                    prev_state, state = state, env.get_state()
-                    container.add_datum(traj_iter, step_iter, action=action, state_diff=state - prev_state)
-                    if step_iter == (args.num_steps - 1):
-                        container.add_datum(traj_iter, step_iter + 1, state=state, **obs)
-
-                if args.visualize:
-                    env.render()
-                    try:
-                        image_visualizer.update(obs.values())
-                        if args.record_file:
-                            writer.grab_frame()
-                    except:
+    try:
+        for traj_iter, (observations, states, actions, stopped) in enumerate(trajs):
+            print('traj_iter', traj_iter)
+            if pool and args.visualize:
+                # the trajectory is played back here while the workers keep stepping their environments, so the
+                # plotting and recording don't slow down the data collection
+                for step_iter in range(1, len(actions) + 1):
+                    if visualize(OrderedDict([(name, observation[step_iter]) for (name, observation) in observations.items()])):
                         done = True
-                if done:
-                    break
-            if done:
+                        break
+            if container:
+                # write the whole trajectory at once
+                container.add_data(traj_iter, state=states, **observations)
+                if len(actions):
+                    container.add_data(traj_iter, action=actions, state_diff=np.subtract(states[1:], states[:-1]))
+            if done or stopped:  # the visualization was closed
                 break
-        except KeyboardInterrupt:
-            break
-    env.close()
+    except KeyboardInterrupt:
+        pass
+    if pool:
+        pool.terminate()
+        pool.join()
+    else:
+        env.close()
     if args.record_file:
         writer.finish()
     if container:
@@ -2,7 +2,7 @@ import argparse
 import yaml
 
 from visual_dynamics import envs
-from visual_dynamics.utils.config import from_config, to_yaml
+from visual_dynamics.utils.config import Python2to3Loader, from_config, to_yaml
 
 
 def main():
@@ -14,7 +14,7 @@ def main():
     args = parser.parse_args()
 
     with open(args.env_fname) as env_file:
-        env_config = yaml.load(env_file)
+        env_config = yaml.load(env_file, Loader=Python2to3Loader)
         if issubclass(env_config['class'], envs.RosEnv):
             import rospy
             rospy.init_node("generate_reset_states")
@@ -1,20 +1,46 @@
+import importlib
+import sys
+
 from .base import Env
 from .env_spec import EnvSpec
-try:
-    from .servoing_env import ServoingEnv
-    from .panda3d_env import Panda3dEnv
-    from .car_panda3d_env import CarPanda3dEnv, StraightCarPanda3dEnv, SimpleGeometricCarPanda3dEnv, GeometricCarPanda3dEnv
-    from .quad_panda3d_env import SimpleQuadPanda3dEnv, Point3dSimpleQuadPanda3dEnv
-except ImportError:
-    pass
-try:
-    from .ros_env import RosEnv
-    from .pr2_env import Pr2Env
-    from .quad_ros_env import QuadRosEnv
-    from .transform_quad_ros_env import TransformQuadRosEnv
-except ImportError:
-    pass
-try:
-    from .rllab_env import RllabEnv
-except ImportError:
-    pass
+
+# The remaining environments are only imported when they are first accessed
+# since their modules pull in heavy dependencies (e.g. panda3d, rospy, rllab).
+# Environments whose dependencies are not installed are not available.
+_env_module_names = {
+    'ServoingEnv': 'servoing_env',
+    'Panda3dEnv': 'panda3d_env',
+    'CarPanda3dEnv': 'car_panda3d_env',
+    'StraightCarPanda3dEnv': 'car_panda3d_env',
+    'SimpleGeometricCarPanda3dEnv': 'car_panda3d_env',
+    'GeometricCarPanda3dEnv': 'car_panda3d_env',
+    'SimpleQuadPanda3dEnv': 'quad_panda3d_env',
+    'Point3dSimpleQuadPanda3dEnv': 'quad_panda3d_env',
+    'RosEnv': 'ros_env',
+    'Pr2Env': 'pr2_env',
+    'QuadRosEnv': 'quad_ros_env',
+    'TransformQuadRosEnv': 'transform_quad_ros_env',
+    'RllabEnv': 'rllab_env',
+}
+
+
+def __getattr__(name):
+    module_name = _env_module_names.get(name)
+    if module_name is None:
+        raise AttributeError('module %r has no attribute %r' % (__name__, name))
+    try:
+        module = importlib.import_module('.' + module_name, __name__)
+    except ImportError as e:
+        raise AttributeError('module %r has no attribute %r since %s could not be imported: %s' %
+                             (__name__, name, module_name, e))
+    env_class = getattr(module, name)
+    globals()[name] = env_class
+    return env_class
+
+
+if sys.version_info < (3, 7):  # module-level __getattr__ is not supported, so import everything that is available
+    for _name in _env_module_names:
+        try:
+            __getattr__(_name)
+        except AttributeError:
+            pass
@@ -9,12 +9,13 @@ from visual_dynamics.utils.config import ConfigObject
 class Predictor(ConfigObject):
     def __init__(self, input_names, input_shapes, transformers=None, name=None):
         self.input_names = input_names
-        self.input_shapes = input_shapes
+        # shapes are stored as tuples so that they can be compared directly against the shapes of numpy arrays
+        self.input_shapes = [tuple(input_shape) for input_shape in input_shapes]
         self.transformers = transformers or dict()
         for input_name in self.input_names:
             if input_name not in self.transformers:
                 self.transformers[input_name] = Transformer()  # identity transformation by default
-        self.preprocessed_input_shapes = [self.transformers[input_name].preprocess_shape(input_shape)
+        self.preprocessed_input_shapes = [tuple(self.transformers[input_name].preprocess_shape(input_shape))
                                           for (input_name, input_shape) in zip(self.input_names, self.input_shapes)]
         self.name = name or self.__class__.__name__
 
@@ -33,7 +34,7 @@ class Predictor(ConfigObject):
         """
         raise NotImplementedError
 
-    def jacobian(self, name_or_names, wrt_name, inputs, **kwargs):
+    def jacobian(self, name_or_names, wrt_name, inputs, ret_outputs=False, **kwargs):
         """
         Returns the Jacobian(s) with respect to the variable wrt_name
 
@@ -41,11 +42,15 @@ class Predictor(ConfigObject):
             name_or_names: string or (possibly nested) list of strings.
             wrt_name: string of the with-respect-to variable.
             inputs: list of numpy arrays.
+            ret_outputs: if True, the output(s) corresponding to name_or_names
+                are also returned. These are computed by the same forward pass
+                used for the Jacobian(s).
 
         Returns:
             the numpy array Jacobian(s) corresponding to the given name(s). The
             (possibly nested) structure of the returned output(s) matches the
-            structure of name_or_names.
+            structure of name_or_names. If ret_outputs is True, a list of the
+            Jacobian(s) and the output(s) is returned instead.
         """
         raise NotImplementedError
 
@@ -56,9 +61,8 @@ class Predictor(ConfigObject):
             preprocessed_inputs = [self.transformers[name].preprocess(input_)
                                    for (name, input_) in zip(self.input_names, inputs)]
         else:
-            batched_inputs = inputs
-            preprocessed_inputs = zip(*[self.preprocess(inputs) for inputs in zip(*batched_inputs)])
-            preprocessed_inputs = [np.array(preprocessed_input) for preprocessed_input in preprocessed_inputs]
+            preprocessed_inputs = [self.transformers[name].preprocess_batch(input_)
+                                   for (name, input_) in zip(self.input_names, inputs)]
         return preprocessed_inputs
 
     def batch_size(self, inputs, preprocessed=False):
@@ -77,7 +81,7 @@ class Predictor(ConfigObject):
                     raise ValueError('expecting input of shape %r or %r but got input of shape %r' %
                                      (shape, (None,) + shape, input_.shape))
             else:
-                if input_.shape == shape or input_.shape == ((batch_size,) + shape):
+                if input_.shape == shape or (input_.shape[1:] == shape and input_.shape[0] == batch_size):
                     continue
                 else:
                     raise ValueError('expecting input of shape %r or %r but got input of shape %r' %
@@ -130,9 +134,9 @@ class FeaturePredictor(Predictor):
                 self.predict([self.feature_jacobian_name, self.next_feature_name],
                              inputs, preprocessed=preprocessed)
         else:
-            jac = self.jacobian(self.next_feature_name, self.control_name,
-                                inputs, preprocessed=preprocessed)
-            next_feature = self.next_feature(inputs, preprocessed=preprocessed)
+            jac, next_feature = self.jacobian(self.next_feature_name, self.control_name,
+                                              inputs, preprocessed=preprocessed,
+                                              ret_outputs=True)
         return jac, next_feature
 
     def _get_config(self):
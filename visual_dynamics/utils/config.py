@@ -8,6 +8,10 @@ from yaml.parser import Parser
 from yaml.reader import Reader
 from yaml.resolver import Resolver
 from yaml.scanner import Scanner
+try:
+    from yaml.cyaml import CParser
+except ImportError:  # PyYAML was built without LibYAML
+    CParser = None
 
 from visual_dynamics.utils.python3 import get_signature_args
 
@@ -21,15 +25,25 @@ class Python2to3Constructor(Constructor):
         return Constructor.find_python_name(self, name, mark)
 
 
-class Python2to3Loader(Reader, Scanner, Parser, Composer, Python2to3Constructor, Resolver):
-
-    def __init__(self, stream):
-        Reader.__init__(self, stream)
-        Scanner.__init__(self)
-        Parser.__init__(self)
-        Composer.__init__(self)
-        Python2to3Constructor.__init__(self)
-        Resolver.__init__(self)
+if CParser is not None:
+    class Python2to3Loader(CParser, Python2to3Constructor, Resolver):
+        """
+        Same as the pure Python loader below but parses using LibYAML.
+        """
+        def __init__(self, stream):
+            CParser.__init__(self, stream)
+            Python2to3Constructor.__init__(self)
+            Resolver.__init__(self)
+else:
+    class Python2to3Loader(Reader, Scanner, Parser, Composer, Python2to3Constructor, Resolver):
+
+        def __init__(self, stream):
+            Reader.__init__(self, stream)
+            Scanner.__init__(self)
+            Parser.__init__(self)
+            Composer.__init__(self)
+            Python2to3Constructor.__init__(self)
+            Resolver.__init__(self)
 
 
 def get_config(instance):
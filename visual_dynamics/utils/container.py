@@ -32,6 +32,7 @@ class DataContainer(object):
         self.mode = mode
         self.info_file = None
         self.hdf5_file = None
+        self._dsets = dict()  # open datasets, reused across calls to add_datum and get_datum
 
         info_fname = os.path.join(self.data_dir, 'info.yaml')
         self.info_file = open_23(info_fname, mode)
@@ -42,7 +43,8 @@ class DataContainer(object):
         self.data_shapes_dict = self.info_dict.get('data_shapes', None) or dict()
         self.datum_shapes_dict = self.info_dict.get('datum_shapes', None) or dict()
         data_fname = os.path.join(self.data_dir, 'data.h5')
-        self.hdf5_file = h5py.File(data_fname, mode)
+        # larger chunk cache so that the chunks of all the datasets being written fit in it
+        self.hdf5_file = h5py.File(data_fname, mode, rdcc_nbytes=64 * 1024 * 1024, rdcc_nslots=10007)
 
     def close(self):
         if self.info_file:
@@ -56,6 +58,7 @@ class DataContainer(object):
             self.info_file.close()
             self.info_file = None
         if self.hdf5_file:
+            self._dsets.clear()
             self.hdf5_file.close()
             self.hdf5_file = None
 
@@ -101,12 +104,38 @@ class DataContainer(object):
                 raise ValueError('unable to add datum %s with shape %s since the shape %s was expected' %
                                  (name, value.shape, self.datum_shapes_dict[name]))
             self.datum_shapes_dict[name] = value.shape
-            datum_size = self.get_data_size(name)
-            shape = (datum_size, ) + value.shape
-            dset = self.hdf5_file.require_dataset(name, shape, value.dtype, exact=True)
+            dset = self._require_dataset(name, value.shape, value.dtype)
             datum_ind = self._get_datum_ind(*(inds + (name,)))
             dset[datum_ind] = value
 
+    def add_data(self, *inds, **data_dict):
+        """
+        Adds multiple data at once, e.g. all the time steps of a trajectory.
+
+        The indices specify the leading dimensions of the reserved shape and
+        the remaining dimensions are given by the leading dimensions of each
+        value. Only the first remaining dimension can be partially filled.
+        """
+        for name, value in data_dict.items():
+            data_shape = self.get_data_shape(name)
+            num_inds = len(data_shape) - len(inds)
+            if not (0 < num_inds <= value.ndim and
+                    value.shape[0] <= data_shape[len(inds)] and
+                    value.shape[1:num_inds] == data_shape[len(inds) + 1:]):
+                raise ValueError('unable to add data %s with shape %s at indices %r since it was reserved with shape %s' %
+                                 (name, value.shape, inds, data_shape))
+            datum_shape = value.shape[num_inds:]
+            if name in self.datum_shapes_dict and self.datum_shapes_dict[name] != datum_shape:
+                raise ValueError('unable to add datum %s with shape %s since the shape %s was expected' %
+                                 (name, datum_shape, self.datum_shapes_dict[name]))
+            self.datum_shapes_dict[name] = datum_shape
+            if value.shape[0] == 0:
+                continue
+            dset = self._require_dataset(name, datum_shape, value.dtype)
+            start_datum_ind = self._get_datum_ind(*(inds + (0,) * num_inds + (name,)))
+            num_data = int(np.prod(value.shape[:num_inds]))
+            dset[start_datum_ind:start_datum_ind + num_data] = value.reshape((num_data, ) + datum_shape)
+
     def get_datum(self, *inds_and_datum_names):
         inds, datum_names = inds_and_datum_names[:-1], inds_and_datum_names[-1]
         if isinstance(datum_names, str):
@@ -116,7 +145,8 @@ class DataContainer(object):
         datum = []
         for name in names:
             datum_ind = self._get_datum_ind(*(inds + (name,)))
-            datum.append(self.hdf5_file[name][datum_ind][()])
+            dset = self._dsets.get(name) or self._dsets.setdefault(name, self.hdf5_file[name])
+            datum.append(dset[datum_ind][()])
         if isinstance(datum_names, str):
             datum, = datum
         return datum
@@ -136,6 +166,18 @@ class DataContainer(object):
     def get_data_size(self, name):
         return np.prod(self.get_data_shape(name))
 
+    def _require_dataset(self, name, datum_shape, dtype):
+        dset = self._dsets.get(name)
+        if dset is None:
+            datum_size = self.get_data_size(name)
+            shape = (datum_size, ) + datum_shape
+            # each chunk spans the last reserved dimension (e.g. all the time steps of a trajectory) so that
+            # consecutive writes and reads along that dimension hit the same chunk
+            chunks = (self.get_data_shape(name)[-1], ) + datum_shape
+            dset = self.hdf5_file.require_dataset(name, shape, dtype, exact=True, chunks=chunks)
+            self._dsets[name] = dset
+        return dset
+
     def _get_canonical_inds(self, *inds_and_name):
         inds, name = inds_and_name[:-1], inds_and_name[-1]
         inds = list(inds)
@@ -206,17 +248,30 @@ class ImageDataContainer(DataContainer):
         super(ImageDataContainer, self).add_datum(*inds, **other_dict)
         image_dict = dict([item for item in datum_dict.items() if item[0].endswith('image')])
         for image_name, image in image_dict.items():
-            if image_name in self.datum_shapes_dict and self.datum_shapes_dict[image_name] != image.shape:
-                raise ValueError('unable to add datum %s with shape %s since the shape %s was expected' %
-                                 (image_name, image.shape, self.datum_shapes_dict[image_name]))
-            self.datum_shapes_dict[image_name] = image.shape
-            image_fname = self._get_image_fname(*(inds + (image_name,)))
-            if image.dtype == np.uint8:
-                if image.ndim == 3 and image.shape[2] == 3:
-                    image = cv2.cvtColor(image, cv2.COLOR_RGB2BGR)
-            else:
-                image = math_utils.pack_image(image)
-            cv2.imwrite(image_fname, image, [int(cv2.IMWRITE_JPEG_QUALITY), 100])
+            self._add_image(*(inds + (image_name, image)))
+
+    def add_data(self, *inds, **data_dict):
+        other_dict = dict([item for item in data_dict.items() if not item[0].endswith('image')])
+        super(ImageDataContainer, self).add_data(*inds, **other_dict)
+        image_dict = dict([item for item in data_dict.items() if item[0].endswith('image')])
+        for image_name, images in image_dict.items():
+            num_inds = len(self.get_data_shape(image_name)) - len(inds)
+            for image_inds in np.ndindex(*images.shape[:num_inds]):
+                self._add_image(*(inds + image_inds + (image_name, images[image_inds])))
+
+    def _add_image(self, *inds_and_name_and_image):
+        inds, image_name, image = inds_and_name_and_image[:-2], inds_and_name_and_image[-2], inds_and_name_and_image[-1]
+        if image_name in self.datum_shapes_dict and self.datum_shapes_dict[image_name] != image.shape:
+            raise ValueError('unable to add datum %s with shape %s since the shape %s was expected' %
+                             (image_name, image.shape, self.datum_shapes_dict[image_name]))
+        self.datum_shapes_dict[image_name] = image.shape
+        image_fname = self._get_image_fname(*(inds + (image_name,)))
+        if image.dtype == np.uint8:
+            if image.ndim == 3 and image.shape[2] == 3:
+                image = cv2.cvtColor(image, cv2.COLOR_RGB2BGR)
+        else:
+            image = math_utils.pack_image(image)
+        cv2.imwrite(image_fname, image, [int(cv2.IMWRITE_JPEG_QUALITY), 100])
 
     def _get_image_fname(self, *inds_and_name, **kwargs):
         inds, name = inds_and_name[:-1], inds_and_name[-1]
@@ -304,6 +359,9 @@ class MultiDataContainer(DataContainer):
     def add_datum(self, *inds, **datum_dict):
         raise NotImplementedError
 
+    def add_data(self, *inds, **data_dict):
+        raise NotImplementedError
+
     def get_datum(self, *inds_and_datum_names):
         raise NotImplementedError
 
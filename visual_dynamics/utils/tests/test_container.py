@@ -0,0 +1,50 @@
+import os
+import shutil
+import tempfile
+
+import numpy as np
+from nose2 import tools
+
+from visual_dynamics.utils.container import DataContainer, ImageDataContainer
+
+
+def check_add_data_add_datum(container_class, name, shape, data, num_data):
+    """
+    Adds the data one datum at a time to one container and in blocks of the
+    last dimension to another one, where only the first num_data entries of
+    the last dimension are added, and checks that both containers agree.
+    """
+    tmp_dir = tempfile.mkdtemp()
+    try:
+        datum_dir, data_dir = os.path.join(tmp_dir, 'datum'), os.path.join(tmp_dir, 'data')
+        with container_class(datum_dir, 'x') as datum_container, container_class(data_dir, 'x') as data_container:
+            datum_container.reserve(name, shape)
+            data_container.reserve(name, shape)
+            for inds in np.ndindex(*(shape[:-1] + (num_data,))):
+                datum_container.add_datum(*inds, **{name: data[inds]})
+            for inds in np.ndindex(*shape[:-1]):
+                data_container.add_data(*inds, **{name: data[inds][:num_data]})
+            for inds in np.ndindex(*(shape[:-1] + (num_data,))):
+                datum = datum_container.get_datum(*(inds + (name,)))
+                datum_prime = data_container.get_datum(*(inds + (name,)))
+                assert np.all(datum == datum_prime), "Expected {} to equal {}".format(datum, datum_prime)
+    finally:
+        shutil.rmtree(tmp_dir)
+
+
+@tools.params(((3, 5), 5),
+              ((3, 1), 1),
+              ((2, 3, 4), 4),
+              ((3, 5), 2),  # partial trajectories, e.g. when the data collection is stopped early
+              ((2, 3, 4), 1),
+              ((3, 5), 0))
+def test_add_data_add_datum(shape, num_data):
+    data = np.random.random(shape + (2, 3))
+    check_add_data_add_datum(DataContainer, 'x', shape, data, num_data)
+
+
+@tools.params(((3, 4), 4),
+              ((3, 4), 2))
+def test_image_add_data_add_datum(shape, num_data):
+    data = np.random.randint(0, 256, shape + (8, 6, 3)).astype(np.uint8)
+    check_add_data_add_datum(ImageDataContainer, 'image', shape, data, num_data)
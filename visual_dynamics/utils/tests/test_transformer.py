@@ -53,3 +53,26 @@ def test_process_shape_roundtripping(transformer):
     shape_prime = transformer.deprocess_shape(pre_data.shape)
     assert shape_prime == data.shape, "Expected {} to equal {}".format(shape_prime, data.shape)
     assert pre_shape_prime == pre_data.shape, "Expected {} to equal {}".format(pre_shape_prime, pre_data.shape)
+
+
+@tools.params(Transformer(),
+              OpsTransformer(scale=2.0, offset=-1.0),
+              OpsTransformer(scale=2.0 / 255.0, offset=-1.0, exponent=-1, transpose=(2, 0, 1)),
+              ImageTransformer(scale_size=0.5, crop_size=[16, 16], crop_offset=[0, 0]),
+              CompositionTransformer([]),
+              CompositionTransformer(
+                  [OpsTransformer(scale=2.0 / 255.0, offset=-1.0, transpose=(2, 0, 1)),
+                   ImageTransformer(scale_size=0.5, crop_size=[16, 16], crop_offset=[0, 0])]),
+              )
+def test_preprocess_batch(transformer):
+    data = np.random.random((4, 48, 64, 3))
+    pre_data = np.array([transformer.preprocess(datum) for datum in data])
+    pre_data_batch = transformer.preprocess_batch(data)
+    assert pre_data_batch.shape == pre_data.shape, "Expected {} to equal {}".format(pre_data_batch.shape, pre_data.shape)
+    assert np.allclose(pre_data_batch, pre_data), "Expected {} to equal {}".format(pre_data_batch, pre_data)
+
+
+def test_preprocess_batch_identity():
+    data = np.random.random((4, 48, 64, 3))
+    pre_data_batch = Transformer().preprocess_batch(data)
+    assert pre_data_batch is data, "Expected the identity transformer to return the data without copying it"
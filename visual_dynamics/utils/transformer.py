@@ -10,6 +10,22 @@ class Transformer(ConfigObject):
     def preprocess(self, data):
         return data
 
+    def preprocess_batch(self, data):
+        """
+        Preprocesses each datum along the leading axis of data.
+        """
+        if type(self).preprocess == Transformer.preprocess:  # identity, so the data is returned without copying it
+            return np.asarray(data)
+        if len(data) == 0:
+            return np.empty((0,) + tuple(self.preprocess_shape(data.shape[1:])))
+        # the output is allocated once the shape and dtype of the first preprocessed datum are known
+        datum = np.asarray(self.preprocess(data[0]))
+        preprocessed_data = np.empty((len(data),) + datum.shape, dtype=datum.dtype)
+        preprocessed_data[0] = datum
+        for i in range(1, len(data)):
+            preprocessed_data[i] = self.preprocess(data[i])
+        return preprocessed_data
+
     def deprocess(self, data):
         return data
 
@@ -44,6 +60,20 @@ class OpsTransformer(Transformer):
             data = np.transpose(data, self.transpose)
         return data
 
+    def preprocess_batch(self, data):
+        # a 6-vector (e.g. a translation and an axis-angle rotation) with a 4-vector scale or offset uses the first 3
+        # entries for the translation and the last entry for the whole rotation, which doesn't broadcast, so each
+        # datum goes through preprocess
+        if data.shape[1:] == (6,) and (self.scale.shape == (4,) or self.offset.shape == (4,)):
+            return super(OpsTransformer, self).preprocess_batch(data)
+        self._data_dtype = data.dtype
+        data = self.scale * data + self.offset
+        if self.exponent != 1.0:
+            data = np.power(data, self.exponent)
+        if self.transpose:
+            data = np.ascontiguousarray(np.transpose(data, (0,) + tuple(axis + 1 for axis in self.transpose)))
+        return data
+
     def deprocess(self, data):
         if self.transpose:
             data = np.transpose(data, self.transpose_inv)
@@ -212,6 +242,11 @@ class CompositionTransformer(Transformer):
             data = transformer.preprocess(data)
         return data
 
+    def preprocess_batch(self, data):
+        for transformer in self.transformers:
+            data = transformer.preprocess_batch(data)
+        return data
+
     def deprocess(self, data):
         for transformer in reversed(self.transformers):
             data = transformer.deprocess(data)
@@ -1,8 +1,8 @@
 from __future__ import division, print_function
 
+import math
 import os
 import re
-import subprocess
 
 import cv2
 import numpy as np
@@ -14,7 +14,10 @@ try:
     import gazebo_msgs.srv
 except ImportError:
     pass
-import time
+
+
+# null file shared by the suppression context managers, which is opened only once
+_null_fd = os.open(os.devnull, os.O_RDWR)
 
 
 class suppress_stdout(object):
@@ -23,26 +26,15 @@ class suppress_stdout(object):
     Python, i.e. will suppress all print, even if the print originates in a
     compiled C/Fortran sub-function.
     '''
-    def __init__(self):
-        # Open a null file
-        while True:
-            try:
-                self.null_fds =  os.open(os.devnull, os.O_RDWR)
-                break
-            except OSError:
-                time.sleep(1)
+    def __enter__(self):
         # Save the actual stdout file descriptor
         self.save_fds = os.dup(1)
-
-    def __enter__(self):
-        # Assign the null pointers to stdout
-        os.dup2(self.null_fds, 1)
-        os.close(self.null_fds)
+        # Assign the null pointer to stdout
+        os.dup2(_null_fd, 1)
 
     def __exit__(self, *_):
         # Re-assign the real stdout back
         os.dup2(self.save_fds, 1)
-        # Close the null file
         os.close(self.save_fds)
 
 
@@ -56,64 +48,118 @@ class suppress_stdout_stderr(object):
     exited (at least, I think that is why it lets exceptions through).
 
     '''
-    def __init__(self):
-        # Open a pair of null files
-        self.null_fds =  [os.open(os.devnull,os.O_RDWR) for x in range(2)]
+    def __enter__(self):
         # Save the actual stdout (1) and stderr (2) file descriptors.
         self.save_fds = (os.dup(1), os.dup(2))
-
-    def __enter__(self):
-        # Assign the null pointers to stdout and stderr.
-        os.dup2(self.null_fds[0],1)
-        os.dup2(self.null_fds[1],2)
+        # Assign the null pointer to stdout and stderr.
+        os.dup2(_null_fd, 1)
+        os.dup2(_null_fd, 2)
 
     def __exit__(self, *_):
         # Re-assign the real stdout/stderr back to (1) and (2)
-        os.dup2(self.save_fds[0],1)
-        os.dup2(self.save_fds[1],2)
-        # Close the null files
-        os.close(self.null_fds[0])
-        os.close(self.null_fds[1])
-
-
-def standarize(data, in_min=0, in_max=255, out_min=-1, out_max=1):
-    assert in_min <= data.min() <= data.max() <= in_max
-    return (data.astype(float) - in_min) * (out_max - out_min)/(in_max - in_min) + out_min
+        os.dup2(self.save_fds[0], 1)
+        os.dup2(self.save_fds[1], 2)
+        os.close(self.save_fds[0])
+        os.close(self.save_fds[1])
+
+
+def _rescale(data, in_min, in_max, out_min, out_max, out=None):
+    # data is not checked to be within [in_min, in_max] since that takes two more passes over it
+    # fold the affine map into a single scale and offset
+    scale = (out_max - out_min) / (in_max - in_min)
+    offset = out_min - in_min * scale
+    if out is None:
+        out = np.empty(data.shape, dtype=np.float32)
+    elif out.dtype.kind != 'f':  # checked before writing since out may be data itself
+        raise ValueError('out should be a floating point array, but it has dtype %s' % out.dtype)
+    np.multiply(data, scale, out=out, casting='unsafe')
+    out += offset
+    return out
+
+def standarize(data, in_min=0, in_max=255, out_min=-1, out_max=1, out=None):
+    """
+    Linearly maps data from [in_min, in_max] to [out_min, out_max]. The result
+    is written to out if given (a floating point array, which may be data
+    itself if it is floating point), otherwise to a new float32 array. The values of data are assumed to be within [in_min, in_max].
+    """
+    return _rescale(data, in_min, in_max, out_min, out_max, out=out)
 
-def destandarize(data, in_min=-1, in_max=1, out_min=0, out_max=255):
-    return standarize(data, in_min=in_min, in_max=in_max, out_min=out_min, out_max=out_max)
+def destandarize(data, in_min=-1, in_max=1, out_min=0, out_max=255, out=None):
+    return _rescale(data, in_min, in_max, out_min, out_max, out=out)
 
 def linspace2d(start,end,n):
-    cols = [np.linspace(s,e,n) for (s,e) in zip(start,end)]
-    return np.array(cols).T
+    start = np.asarray(start, dtype=float)
+    end = np.asarray(end, dtype=float)
+    # every column is interpolated at once into a contiguous n x d array
+    points = np.linspace(0.0, 1.0, int(n))[:, None] * (end - start)
+    points += start
+    if n > 1:
+        points[-1] = end
+    return points
 
 def upsample_waypoints(waypoints, max_dist):
-    upsampled_waypoints = []
-    for wp0, wp1 in zip(waypoints[:-1], waypoints[1:]):
-        dist = np.linalg.norm(np.asarray(wp1) - np.asarray(wp0))
-        num = np.ceil(dist/max_dist)
-        upsampled_waypoints.append(linspace2d(wp0, wp1, num))
-    return np.concatenate(upsampled_waypoints)
+    waypoints = np.asarray(waypoints, dtype=float)
+    wps0, wps1 = waypoints[:-1], waypoints[1:]
+    diffs = wps1 - wps0
+    dists = np.sqrt((diffs * diffs).sum(axis=1))
+    nums = np.ceil(dists / max_dist).astype(int)
+    # all the segments are interpolated at once into a single preallocated array
+    ends = np.cumsum(nums)
+    segment_inds = np.repeat(np.arange(len(nums)), nums)
+    steps = np.arange(ends[-1] if len(ends) else 0) - np.repeat(ends - nums, nums)
+    ts = steps / np.maximum(nums - 1, 1)[segment_inds]
+    upsampled_waypoints = wps0[segment_inds]
+    upsampled_waypoints += ts[:, None] * diffs[segment_inds]
+    # the last point of each segment is exactly the end waypoint, as with linspace
+    upsampled_waypoints[(ends - 1)[nums > 1]] = wps1[nums > 1]
+    return upsampled_waypoints
+
+def transforms_from_poses(poses):
+    """
+    Returns the positions and quaternions of the poses as N x 3 and N x 4 arrays
+    """
+    positions = np.array([(pose.position.x, pose.position.y, pose.position.z) for pose in poses], dtype=float)
+    quats = np.array([(pose.orientation.x, pose.orientation.y, pose.orientation.z, pose.orientation.w)
+                      for pose in poses], dtype=float)
+    return positions.reshape((-1, 3)), quats.reshape((-1, 4))
+
+def create_poses_from_transforms(positions, quats):
+    """
+    Returns the poses with the positions and quaternions given as N x 3 and N x 4 arrays
+    """
+    poses = []
+    # the arrays are converted to floats once instead of indexing a numpy scalar for every field
+    for (pos, quat) in zip(np.reshape(positions, (-1, 3)).tolist(), np.reshape(quats, (-1, 4)).tolist()):
+        pose = geometry_msgs.msg.Pose()
+        pose.position.x, pose.position.y, pose.position.z = pos
+        pose.orientation.x, pose.orientation.y, pose.orientation.z, pose.orientation.w = quat
+        poses.append(pose)
+    return poses
 
 def transform_from_pose(pose):
-    pos = np.asarray([pose.position.x, pose.position.y, pose.position.z])
-    quat = np.asarray([pose.orientation.x, pose.orientation.y, pose.orientation.z, pose.orientation.w])
-    return (pos, quat)
+    positions, quats = transforms_from_poses([pose])
+    return (positions[0], quats[0])
 
 def create_pose_from_transform(transform):
     pos, quat = transform
-    pose = geometry_msgs.msg.Pose()
-    pose.position.x = pos[0]
-    pose.position.y = pos[1]
-    pose.position.z = pos[2]
-    pose.orientation.x = quat[0]
-    pose.orientation.y = quat[1]
-    pose.orientation.z = quat[2]
-    pose.orientation.w = quat[3]
-    return pose
+    return create_poses_from_transforms([pos], [quat])[0]
+
+# quaternions of recently used euler angles since poses are often created with the same orientation
+_quaternions_from_euler = {}
+_max_quaternions_from_euler = 4096
+
+def _quaternion_from_euler(roll, pitch, yaw):
+    euler = (float(roll), float(pitch), float(yaw))
+    quat = _quaternions_from_euler.get(euler)
+    if quat is None:
+        if len(_quaternions_from_euler) >= _max_quaternions_from_euler:
+            _quaternions_from_euler.clear()
+        quat = tuple(tf.transformations.quaternion_from_euler(*euler))
+        _quaternions_from_euler[euler] = quat
+    return quat
 
 def create_pose(xyz, roll, pitch, yaw):
-    quat = tf.transformations.quaternion_from_euler(roll, pitch, yaw)
+    quat = _quaternion_from_euler(roll, pitch, yaw)
     return create_pose_from_transform((xyz, quat))
 
 def create_pose_msg(xyz, roll, pitch, yaw, frame_id):
@@ -123,50 +169,101 @@ def create_pose_msg(xyz, roll, pitch, yaw, frame_id):
     pose_stamped.header.stamp = rospy.Time.now()
     return pose_stamped
 
-def get_model_pose(model_name, relative_entity_name='world'):
-    rospy.wait_for_service('gazebo/get_model_state')
+# service proxies are created once and keep their connection to gazebo open across calls
+_service_proxies = {}
+
+def _get_service_proxy(name, service_class):
+    if name not in _service_proxies:
+        rospy.wait_for_service(name)
+        _service_proxies[name] = rospy.ServiceProxy(name, service_class, persistent=True)
+    return _service_proxies[name]
+
+def _close_service_proxy(name):
+    # the connection of a persistent proxy is not reopened after a failure, so a new proxy is created on the next call
+    service_proxy = _service_proxies.pop(name, None)
+    if service_proxy is not None:
+        service_proxy.close()
+
+def get_model_poses(model_names, relative_entity_name='world'):
     try:
-        get_model_state = rospy.ServiceProxy('gazebo/get_model_state', gazebo_msgs.srv.GetModelState)
-        res = get_model_state(model_name, relative_entity_name)
-        return res.pose
+        get_model_state = _get_service_proxy('gazebo/get_model_state', gazebo_msgs.srv.GetModelState)
+        return [get_model_state(model_name, relative_entity_name).pose for model_name in model_names]
     except rospy.ServiceException as e:
+        _close_service_proxy('gazebo/get_model_state')
         print("Service call failed: %s"%e)
 
-def set_model_pose(model_name, model_pose, relative_entity_name='world'):
-    rospy.wait_for_service('gazebo/set_model_state')
+def set_model_poses(model_names, model_poses, relative_entity_name='world'):
     try:
-        set_model_state = rospy.ServiceProxy('gazebo/set_model_state', gazebo_msgs.srv.SetModelState)
-        model_state = gazebo_msgs.msg.ModelState()
-        model_state.model_name = model_name
-        model_state.pose = model_pose
-        model_state.reference_frame = relative_entity_name
-        set_model_state(model_state)
+        set_model_state = _get_service_proxy('gazebo/set_model_state', gazebo_msgs.srv.SetModelState)
+        for model_name, model_pose in zip(model_names, model_poses):
+            model_state = gazebo_msgs.msg.ModelState()
+            model_state.model_name = model_name
+            model_state.pose = model_pose
+            model_state.reference_frame = relative_entity_name
+            set_model_state(model_state)
     except rospy.ServiceException as e:
+        _close_service_proxy('gazebo/set_model_state')
         print("Service call failed: %s"%e)
 
+def get_model_pose(model_name, relative_entity_name='world'):
+    model_poses = get_model_poses([model_name], relative_entity_name=relative_entity_name)
+    if model_poses is not None:
+        return model_poses[0]
+
+def set_model_pose(model_name, model_pose, relative_entity_name='world'):
+    set_model_poses([model_name], [model_pose], relative_entity_name=relative_entity_name)
+
 def arrowed_line(img, pt1, pt2, color, thickness=1, shift=0, tip_length=0.1):
     # adapted from http://mlikihazar.blogspot.com.au/2013/02/draw-arrow-opencv.html
-    if img.ndim == 1:
-        img = np.repeat(img[:, :, None], 3, axis=2)
-    pt1 = np.asarray(pt1, dtype=int)
-    pt2 = np.asarray(pt2, dtype=int)
+    # the arrow is drawn in place, so grayscale images should be converted to bgr by the caller
+    pt1 = tuple(int(x) for x in pt1)
+    pt2 = tuple(int(x) for x in pt2)
     color = tuple(color)
     # draw arrow tail
-    cv2.line(img, tuple(pt1), tuple(pt2), color, thickness=thickness, shift=shift)
-    # calc angle of the arrow
-    angle = np.arctan2(pt1[1]-pt2[1], pt1[0]-pt2[0])
+    cv2.line(img, pt1, pt2, color, thickness=thickness, shift=shift)
+    # unit direction of the arrow, pointing from the tip to the tail
+    dx, dy = pt1[0] - pt2[0], pt1[1] - pt2[1]
+    length = math.hypot(dx, dy)
+    if length:
+        ux, uy = dx / length, dy / length
+    else:
+        ux, uy = 1.0, 0.0
+    # the two lines of the arrow head are the direction rotated by +pi/4 and -pi/4, and tip_length is in pixels
+    c = s = math.sqrt(0.5)
     # starting point of first line of arrow head
-    pt = (int(pt2[0] + tip_length * np.cos(angle + np.pi/4)),
-          int(pt2[1] + tip_length * np.sin(angle + np.pi/4)))
+    pt = (int(pt2[0] + tip_length * (c*ux - s*uy)),
+          int(pt2[1] + tip_length * (s*ux + c*uy)))
     # draw first half of arrow head
-    cv2.line(img, tuple(pt), tuple(pt2), color, thickness=thickness, shift=shift)
+    cv2.line(img, pt, pt2, color, thickness=thickness, shift=shift)
     # starting point of second line of arrow head
-    pt = (int(pt2[0] + tip_length * np.cos(angle - np.pi/4)),
-          int(pt2[1] + tip_length * np.sin(angle - np.pi/4)))
+    pt = (int(pt2[0] + tip_length * (c*ux + s*uy)),
+          int(pt2[1] + tip_length * (c*uy - s*ux)))
     # draw second half of arrow head
-    cv2.line(img, tuple(pt), tuple(pt2), color, thickness=thickness, shift=shift)
+    cv2.line(img, pt, pt2, color, thickness=thickness, shift=shift)
+
+def _image_from_data(data, offset, scale):
+    """
+    Returns the contiguous height x width x channel uint8 image with values
+    (data + offset) * scale, where data is a channel x height x width array.
+    """
+    image = np.empty(data.shape[1:] + data.shape[:1], dtype=np.uint8)
+    # scratch channel reused for every channel, and the uint8 cast happens when it is copied into the image
+    channel = np.empty(data.shape[1:], dtype=np.result_type(data.dtype, np.float32))
+    for c in range(data.shape[0]):
+        np.add(data[c], offset, out=channel)
+        channel *= scale
+        image[:, :, c] = channel
+    return image
 
 def resize_from_scale(image, rescale_factor):
+    if rescale_factor >= 1 and float(rescale_factor).is_integer():
+        # nearest neighbor upsampling by an integer factor repeats every pixel along both axes
+        k = int(rescale_factor)
+        h, w = image.shape[:2]
+        channel_shape = image.shape[2:] if image.shape[2:] != (1,) else ()  # cv2 drops a single channel axis
+        resized_image = np.empty((h, k, w, k) + channel_shape, dtype=image.dtype)
+        resized_image[...] = image.reshape((h, 1, w, 1) + channel_shape)
+        return resized_image.reshape((h * k, w * k) + channel_shape)
     return cv2.resize(image, (0, 0), fx=rescale_factor, fy=rescale_factor, interpolation=cv2.INTER_NEAREST)
 
 def resize_from_height(image, height, ret_factor=False):
@@ -180,23 +277,29 @@ def resize_from_height(image, height, ret_factor=False):
 def create_vis_image(image_curr_data, vel_data, image_diff_data, rescale_factor=1, draw_vel=True, rescale_vel=10):
     assert np.all(image_curr_data >= 0)
     assert np.all(-1 <= image_diff_data) and np.all(image_diff_data <= 1)
-    image_curr = image_curr_data.transpose(1, 2, 0)
-    if image_curr.shape[2] == 1:
-        image_curr = np.squeeze(image_curr, axis=2)
-    image_diff = image_diff_data.transpose(1, 2, 0)
-    if image_diff.shape[2] == 1:
-        image_diff = np.squeeze(image_diff, axis=2)
-    image_next = np.clip(image_curr + image_diff, 0, 1)
-
-    image_curr = (image_curr * 255.0).astype(np.uint8)
-    image_diff = ((image_diff + 1.0) * 255.0 / 2).astype(np.uint8)
-    image_next = (image_next * 255.0).astype(np.uint8)
+    # the arithmetic is done in the original channel x height x width layout and the
+    # transposition to the image layout happens when converting to uint8
+    image_curr = _image_from_data(image_curr_data, 0.0, 255.0)
+    image_diff = _image_from_data(image_diff_data, 1.0, 127.5)
+    # the next image is added, clipped, scaled and cast one channel at a time in a scratch channel
+    image_next = np.empty_like(image_curr)
+    channel = np.empty(image_curr_data.shape[1:],
+                       dtype=np.result_type(image_curr_data.dtype, image_diff_data.dtype, np.float32))
+    for c in range(image_curr_data.shape[0]):
+        np.add(image_curr_data[c], image_diff_data[c], out=channel)
+        np.clip(channel, 0, 1, out=channel)
+        channel *= 255.0
+        image_next[:, :, c] = channel
+    image_curr, image_diff, image_next = [image[:, :, 0] if image.shape[2] == 1 else image
+                                          for image in [image_curr, image_diff, image_next]]
 
     images = [resize_from_scale(image, rescale_factor) for image in [image_curr, image_diff, image_next]]
 
     if draw_vel:
-        # change from grayscale to bgr format
-        images = [np.repeat(image[:, :, None], 3, axis=2) if image.ndim == 2 else image for image in images]
+        # change from grayscale to bgr format, only for the image that is drawn on since the other ones are
+        # broadcasted when they are written into the visualization image
+        if images[0].ndim == 2:
+            images[0] = cv2.cvtColor(images[0], cv2.COLOR_GRAY2BGR)
         h, w = images[0].shape[:2]
         # draw coordinate system
         arrowed_line(images[0],
@@ -220,43 +323,63 @@ def create_vis_image(image_curr_data, vel_data, image_diff_data, rescale_factor=
                      thickness=2,
                      tip_length=rescale_factor*0.4)
 
-    vis_image = np.concatenate(images, axis=1)
+    # the images are written side by side into a preallocated visualization image
+    h, w = images[0].shape[:2]
+    vis_image = np.empty((h, w * len(images)) + images[0].shape[2:], dtype=np.uint8)
+    for i, image in enumerate(images):
+        vis_image[:, i * w:(i + 1) * w] = image if image.ndim == vis_image.ndim else image[:, :, None]
     return vis_image
 
+def _serial_number_from_sysfs_device(device_dir):
+    # the serial number is an attribute of the closest usb device (the one with an idVendor attribute) that is an
+    # ancestor of the video device. The search stops there since the serial numbers of the hubs and host controllers
+    # further up are not the camera's.
+    device_dir = os.path.realpath(device_dir)
+    while device_dir != os.path.dirname(device_dir):
+        if os.path.isfile(os.path.join(device_dir, 'idVendor')):
+            serial_fname = os.path.join(device_dir, 'serial')
+            if not os.path.isfile(serial_fname):
+                return None
+            with open(serial_fname) as serial_file:
+                return serial_file.read().strip() or None
+        device_dir = os.path.dirname(device_dir)
+    return None
+
 def serial_number_from_device_id(device_id):
-    output = subprocess.check_output("udevadm info -a -n /dev/video%d | grep '{serial}' | head -n1"%device_id, shell=True)
-    match = re.match('\s*ATTRS{serial}=="([A-Z0-9]+)"\n', output)
-    if not match:
+    serial_number = _serial_number_from_sysfs_device('/sys/class/video4linux/video%d/device'%device_id)
+    if not serial_number:
         raise RuntimeError('Device id %d does not exist'%device_id)
-    serial_number = match.group(1)
     return serial_number
 
+_video_device_re = re.compile(r'video(\d+)$')
+
 def device_id_from_serial_number(serial_number):
-    for dev_file in  os.listdir('/dev'):
-        match = re.match('video(\d)$', dev_file)
+    # the video devices are enumerated once from sysfs instead of querying udevadm for each of them
+    if not os.path.isdir('/sys/class/video4linux'):
+        return None
+    for dev_name in os.listdir('/sys/class/video4linux'):
+        match = _video_device_re.match(dev_name)
         if match:
-            device_id = int(match.group(1))
-            if serial_number == serial_number_from_device_id(device_id):
-                return device_id
+            device_dir = os.path.join('/sys/class/video4linux', dev_name, 'device')
+            if serial_number == _serial_number_from_sysfs_device(device_dir):
+                return int(match.group(1))
     return None
 
+_camera_id_to_serial_number = dict([('A', 'EE96593F'),
+                                    ('B', 'E8FE493F'),
+                                    ('C', 'C3D6593F'),
+                                    ('D', '6ACE493F')])
+_serial_number_to_camera_id = dict([(serial_number, camera_id) for (camera_id, serial_number) in _camera_id_to_serial_number.items()])
+
 def serial_number_from_camera_id(camera_id):
-    serial_number = dict([('A', 'EE96593F'),
-                          ('B', 'E8FE493F'),
-                          ('C', 'C3D6593F'),
-                          ('D', '6ACE493F')])
-    if camera_id not in serial_number:
+    if camera_id not in _camera_id_to_serial_number:
         raise RuntimeError('Camera id %s does not exist'%camera_id)
-    return serial_number[camera_id]
+    return _camera_id_to_serial_number[camera_id]
 
 def camera_id_from_serial_number(serial_number):
-    camera_id = dict([('EE96593F', 'A'),
-                      ('E8FE493F', 'B'),
-                      ('C3D6593F', 'C'),
-                      ('6ACE493F', 'D')])
-    if serial_number not in camera_id:
+    if serial_number not in _serial_number_to_camera_id:
         raise RuntimeError('Serial number %s does not exist'%serial_number)
-    return camera_id[serial_number]
+    return _serial_number_to_camera_id[serial_number]
 
 def device_id_from_camera_id(camera_id):
     return device_id_from_serial_number(serial_number_from_camera_id(camera_id))
@@ -270,21 +393,33 @@ def yes_or_no(question):
         elif yn == 'n':
             return False
 
+# observation value in [-1, 1] of each uint8 pixel value
+_OBS_LUT = np.arange(256, dtype=np.float32) / 127.5 - 1.0
+
+def _obs_from_channel(channel, out=None):
+    if out is None:
+        out = np.empty(channel.shape, dtype=np.float32)
+    if channel.dtype == np.uint8:
+        np.take(_OBS_LUT, channel, out=out)
+    else:
+        np.multiply(channel, 2.0 / 255.0, out=out, casting='unsafe')
+        out -= 1.0
+    return out
+
 def obs_from_image(image):
     """
     image: height x width x channel array of type uint8 with values in [0, 255]
     """
-    obs = (image.astype(float) / 255.0) * 2.0 - 1.0
-    if obs.ndim == 2:
-        obs = obs[None, :, :]
-    else:
-        obs = obs.transpose(2, 0, 1)
+    if image.ndim == 2:  # grayscale images are handled as single channel images
+        image = image[:, :, None]
+    # write each channel directly into the channel x height x width layout instead of transposing
+    obs = np.empty((image.shape[2],) + image.shape[:2], dtype=np.float32)
+    for c in range(image.shape[2]):
+        _obs_from_channel(image[:, :, c], out=obs[c])
     return obs
 
 def image_from_obs(obs):
     """
     obs: channel x height x width array of type float with values in [-1, 1]
     """
-    image = obs.transpose(1, 2, 0)
-    image = ((image + 1.0) * 255.0 / 2.0).astype(np.uint8)
-    return image
+    return _image_from_data(obs, 1.0, 127.5)